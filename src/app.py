@@ -1,16 +1,16 @@
 # src/app.py
 import os
 import uuid
-import json
+import orjson
+import msgspec
 import shutil
 import time
 import logging
 import tempfile
 from typing import Optional
 from fastapi import FastAPI, UploadFile, File, Form, HTTPException
-from fastapi.responses import JSONResponse
-from pydantic import BaseModel
-from pipeline import process_audio_file
+from fastapi.responses import ORJSONResponse, StreamingResponse
+from pipeline import process_audio_file, stream_audio_file, preload_models, BatchScheduler
 from utils import setup_logging
 
 setup_logging()
@@ -18,14 +18,53 @@ logger = logging.getLogger("transcribe_api")
 
 app = FastAPI(title="Audio Transcription + Separation API",
               version="0.1.0",
-              description="POST /v1/transcribe with multipart/form-data `file` and optional `config` JSON.")
+              description="POST /v1/transcribe with multipart/form-data `file` and optional `config` JSON.",
+              default_response_class=ORJSONResponse)
 
-class ConfigModel(BaseModel):
+# shared across requests so concurrent uploads are transcribed in one batched pass
+scheduler = BatchScheduler(max_batch=8, max_wait_ms=20)
+
+@app.on_event("startup")
+def start_scheduler():
+    preload_models()
+    scheduler.start()
+
+@app.on_event("shutdown")
+def stop_scheduler():
+    scheduler.stop()
+
+class ConfigModel(msgspec.Struct, kw_only=True):
     language_hint: Optional[str] = None
     enable_separation: Optional[bool] = True
     diarize: Optional[bool] = False
-    model_size: Optional[str] = "small"
+    model_size: Optional[str] = None  # "medium" on GPU, "small" on CPU
     target_sr: Optional[int] = 16000
+    stream: Optional[bool] = False  # NDJSON events instead of a single JSON body
+
+def _encode_event(event: dict, request_id: str, start_total: float) -> bytes:
+    if event["type"] == "info":
+        event["request_id"] = request_id
+    elif event["type"] == "done":
+        total_ms = int((time.time() - start_total) * 1000)
+        event["timings_ms"]["total"] = total_ms
+        logger.info("[%s] Completed streamed request in %dms", request_id, total_ms)
+    return orjson.dumps(event) + b"\n"
+
+async def _ndjson_events(first: dict, events, request_id: str, start_total: float):
+    """
+    Encode pipeline events as NDJSON lines, starting with the already received `first` event.
+    """
+    try:
+        yield _encode_event(first, request_id, start_total)
+        async for event in events:
+            yield _encode_event(event, request_id, start_total)
+    except Exception as e:
+        # headers are already sent, so report the failure in-band
+        logger.exception("[%s] Unexpected error while streaming", request_id)
+        yield orjson.dumps({"type": "error", "request_id": request_id, "error": str(e)}) + b"\n"
+    finally:
+        # on client disconnect this stops the transcription between chunks
+        await events.aclose()
 
 @app.post("/v1/transcribe")
 async def transcribe_endpoint(
@@ -35,32 +74,34 @@ async def transcribe_endpoint(
     """
     POST /v1/transcribe
       - file: audio binary (wav/mp3/m4a/flac/ogg)
-      - config: JSON string (language_hint, enable_separation, diarize, model_size, target_sr)
+      - config: JSON string (language_hint, enable_separation, diarize, model_size, target_sr, stream)
     """
     request_id = str(uuid.uuid4())
     start_total = time.time()
-    logger.info(f"[{request_id}] Received request: filename={file.filename} content_type={file.content_type}")
+    logger.info("[%s] Received request: filename=%s content_type=%s",
+                request_id, file.filename, file.content_type)
 
     # parse config JSON if provided
     try:
-        cfg = ConfigModel(**(json.loads(config) if config else {}))
+        # strict=False keeps pydantic's lenient coercion ("false", 0, "22050")
+        cfg = msgspec.json.decode(config, type=ConfigModel, strict=False) if config else ConfigModel()
     except Exception as e:
         logger.exception("Invalid config JSON")
         raise HTTPException(status_code=400, detail="Invalid config JSON")
 
-    # Basic file-size guard (return 413 if > 200 MB)
-    uploaded_bytes = await file.read()
-    max_bytes = 200 * 1024 * 1024
-    if len(uploaded_bytes) > max_bytes:
-        raise HTTPException(status_code=413, detail="File too large (max 200MB)")
-
     tmpdir = tempfile.mkdtemp(prefix=f"req_{request_id}_")
     try:
+        # stream the upload to disk in 1 MiB chunks; basic file-size guard (return 413 if > 200 MB)
         input_path = os.path.join(tmpdir, file.filename)
+        max_bytes = 200 * 1024 * 1024
+        size = 0
         with open(input_path, "wb") as fh:
-            fh.write(uploaded_bytes)
-        # process pipeline
-        result = process_audio_file(
+            while chunk := await file.read(1 << 20):
+                size += len(chunk)
+                if size > max_bytes:
+                    raise HTTPException(status_code=413, detail="File too large (max 200MB)")
+                fh.write(chunk)
+        pipeline_kwargs = dict(
             input_path=input_path,
             request_id=request_id,
             language_hint=cfg.language_hint,
@@ -68,17 +109,28 @@ async def transcribe_endpoint(
             diarize=cfg.diarize,
             model_size=cfg.model_size,
             target_sr=cfg.target_sr,
-            tmpdir=tmpdir
+            transcribe_fn=scheduler.transcribe
         )
+        if cfg.stream:
+            events = stream_audio_file(**pipeline_kwargs)
+            # decoding and separation happen before the "info" event, so their failures still
+            # get a status code, and the upload is no longer needed once it has arrived
+            first = await events.__anext__()
+            return StreamingResponse(
+                _ndjson_events(first, events, request_id, start_total),
+                media_type="application/x-ndjson"
+            )
+        # process pipeline; subprocess and model work is awaited off the event loop
+        result = await process_audio_file(**pipeline_kwargs)
         total_ms = int((time.time() - start_total) * 1000)
         result["timings_ms"]["total"] = total_ms
         result["request_id"] = request_id
-        logger.info(f"[{request_id}] Completed request in {total_ms}ms")
-        return JSONResponse(status_code=200, content=result)
+        logger.info("[%s] Completed request in %dms", request_id, total_ms)
+        return ORJSONResponse(status_code=200, content=result)
     except HTTPException:
         raise
     except Exception as e:
-        logger.exception(f"[{request_id}] Unexpected error")
+        logger.exception("[%s] Unexpected error", request_id)
         raise HTTPException(status_code=500, detail={"request_id": request_id, "error": str(e)})
     finally:
         # optionally cleanup tmpdir here; keep it for debugging if you prefer
@@ -1,215 +1,598 @@
 # src/pipeline.py
 import os
+import asyncio
 import subprocess
 import time
 import logging
-import glob
-import math
-from typing import Optional, Dict, List
-import soundfile as sf
+import queue
+import bisect
+import string
+import threading
+from collections import OrderedDict
+from concurrent.futures import Future
+from typing import Optional, Dict, List, Callable
 import numpy as np
-import librosa
-import uuid
-import json
-import tempfile
+import soxr
+import torch
 from noisereduce import reduce_noise
 
-from whisper import load_model   # from openai-whisper package
+from demucs.pretrained import get_model
+from demucs.apply import apply_model
+from demucs.audio import convert_audio
+from faster_whisper import WhisperModel, BatchedInferencePipeline, decode_audio   # CTranslate2 backend
+from faster_whisper.vad import VadOptions, get_speech_timestamps, merge_segments
 
 logger = logging.getLogger("transcribe_api.pipeline")
 
-# model cache for fast reuse across requests
-_WHISPER_MODELS = {}
+# model cache for fast reuse across requests; LRU-capped since large models are several GB each
+_WHISPER_MODELS = OrderedDict()
+_WHISPER_CACHE_SIZE = int(os.environ.get("WHISPER_MODEL_CACHE_SIZE", "2"))
+_WHISPER_LOCK = threading.Lock()
+_DEMUCS_MODELS = {}
+_DEMUCS_LOCK = threading.Lock()
+
+# Whisper's native sample rate and encoder window
+WHISPER_SR = 16000
+WHISPER_WINDOW_SEC = 30
 
 def timed():
     return int(time.time() * 1000)
 
-def _ffmpeg_convert_to_wav(input_path: str, output_path: str, target_sr: int = 16000):
+def _torch_device() -> str:
+    if torch.cuda.is_available():
+        return "cuda"
+    if torch.backends.mps.is_available():
+        return "mps"
+    return "cpu"
+
+def _cuda_or_cpu() -> str:
+    return "cuda" if torch.cuda.is_available() else "cpu"
+
+def _whisper_device() -> str:
+    # CTranslate2 has no MPS backend, so Apple GPUs fall back to CPU for Whisper
+    return _cuda_or_cpu()
+
+def _default_model_size() -> str:
+    if os.environ.get("DEFAULT_MODEL"):
+        return os.environ["DEFAULT_MODEL"]
+    # a GPU has headroom for a larger model at similar latency
+    return "medium" if torch.cuda.is_available() else "small"
+
+async def _ffmpeg_decode(input_path: str, target_sr: int = 16000) -> np.ndarray:
+    """
+    Decode any input to a float32 mono array at target_sr, read straight from ffmpeg's
+    stdout as raw f32le so the audio never goes through an intermediate WAV file.
+    """
     cmd = [
-        "ffmpeg", "-y", "-hide_banner", "-loglevel", "error",
+        "ffmpeg", "-hide_banner", "-loglevel", "error",
         "-i", input_path,
-        "-ac", "1", "-ar", str(target_sr),
-        output_path
+        "-f", "f32le", "-ac", "1", "-ar", str(target_sr),
+        "-"
     ]
-    logger.debug("Running ffmpeg: %s", " ".join(cmd))
-    subprocess.check_call(cmd)
-    return output_path
-
-def _read_wav_info(wav_path: str):
-    data, sr = sf.read(wav_path, always_2d=False)
-    if data.ndim > 1:
-        data = data.mean(axis=1)  # to mono
-    duration = len(data) / sr
-    return {"sample_rate": sr, "duration_sec": duration}
-
-def _demucs_separate(input_wav: str, out_dir: str):
-    """
-    Use demucs CLI (installed via pip) to perform two-stem separation: vocals + rest.
-    Returns path to vocals file if found, otherwise raises.
-    """
-    logger.info("Attempting separation with Demucs CLI")
-    cmd = ["demucs", "--two-stems=vocals", "-n", "htdemucs_ft", "--mp3", "-o", out_dir, input_wav]
-    # note: model name 'htdemucs_ft' is a good default; adjust as needed.
-    subprocess.check_call(cmd)
-    # The demucs CLI writes output like out_dir/<input_basename>/vocals.wav
-    base = os.path.splitext(os.path.basename(input_wav))[0]
-    search = []
-    for root, _, files in os.walk(out_dir):
-        for f in files:
-            if f.lower().endswith(".wav") and ("vocals" in f.lower() or "vocals" in root.lower()):
-                search.append(os.path.join(root, f))
-    if not search:
-        raise FileNotFoundError("Demucs produced no vocals file")
-    # pick the first matched file
-    return search[0]
-
-def _noise_reduction_fallback(input_wav: str, output_wav: str):
+    if logger.isEnabledFor(logging.DEBUG):
+        logger.debug("Running ffmpeg: %s", " ".join(cmd))
+    proc = await asyncio.create_subprocess_exec(*cmd, stdout=asyncio.subprocess.PIPE)
+    # a bytearray keeps the resulting numpy view writable (torch/noisereduce need that)
+    pcm = bytearray()
+    while chunk := await proc.stdout.read(1 << 20):
+        pcm += chunk
+    returncode = await proc.wait()
+    if returncode != 0:
+        raise subprocess.CalledProcessError(returncode, cmd)
+    return np.frombuffer(pcm, dtype=np.float32)
+
+def _resample(y: np.ndarray, sr: int, target_sr: int) -> np.ndarray:
+    """
+    Resample with soxr only if the rates differ.
+    """
+    if sr == target_sr:
+        return y
+    return soxr.resample(y, sr, target_sr, quality="HQ")
+
+def _load_demucs_model(name: str = "htdemucs_ft"):
+    with _DEMUCS_LOCK:
+        if name not in _DEMUCS_MODELS:
+            logger.info("Loading Demucs model name=%s", name)
+            model = get_model(name)
+            model.eval()
+            _DEMUCS_MODELS[name] = model
+        return _DEMUCS_MODELS[name]
+
+def _demucs_separate(y: np.ndarray, sr: int, model_name: str = "htdemucs_ft") -> np.ndarray:
+    """
+    Two-stem separation (vocals + rest) with an in-process Demucs model that is loaded once
+    and reused across requests. Returns the vocals stem as a mono array at `sr`.
+    """
+    logger.info("Attempting separation with Demucs")
+    model = _load_demucs_model(model_name)
+    wav = convert_audio(torch.from_numpy(y)[None], sr, model.samplerate, model.audio_channels)
+    # same normalisation the demucs CLI applies before separating
+    ref = wav.mean(0)
+    mean, std = ref.mean(), ref.std() + 1e-8
+    wav = (wav - mean) / std
+    # htdemucs models were trained on 7.8 s segments and refuse anything longer
+    with torch.no_grad():
+        sources = apply_model(model, wav[None], device=_torch_device(), segment=7, split=True, overlap=0.25)[0]
+    vocals = sources[model.sources.index("vocals")].cpu() * std + mean
+    vocals = convert_audio(vocals, model.samplerate, sr, 1)
+    return vocals[0].numpy()
+
+def _noise_reduction_fallback(y: np.ndarray, sr: int) -> np.ndarray:
     """
     Simple spectral gating noise reduction using noisereduce.
     """
     logger.info("Using noise-reduction fallback (noisereduce)")
-    y, sr = librosa.load(input_wav, sr=None, mono=True)
+    y = y.astype(np.float32, copy=False)
     # Estimate noise from first 0.5s (if available)
     noise_clip = y[: min(len(y), int(0.5 * sr))]
-    reduced = reduce_noise(y=y, sr=sr, y_noise=noise_clip)
-    sf.write(output_wav, reduced, sr)
-    return output_wav
+    # stationary gating from a fixed noise profile, with the STFT done in torch
+    reduced = reduce_noise(y=y, sr=sr, y_noise=noise_clip, stationary=True,
+                           n_fft=512, hop_length=128, use_torch=True,
+                           device=_cuda_or_cpu())
+    return reduced.astype(np.float32, copy=False)
 
 def _load_whisper_model(size: str):
-    if size in _WHISPER_MODELS:
-        return _WHISPER_MODELS[size]
-    logger.info("Loading Whisper model size=%s", size)
-    model = load_model(size)
-    _WHISPER_MODELS[size] = model
-    return model
-
-def _transcribe_whisper(model_size: str, audio_path: str, language: Optional[str] = None):
+    with _WHISPER_LOCK:
+        if size in _WHISPER_MODELS:
+            _WHISPER_MODELS.move_to_end(size)
+            return _WHISPER_MODELS[size]
+        device = _whisper_device()
+        # int8 weights run on CTranslate2's quantized GEMM kernels on both CPU and GPU
+        compute_type = "int8_float16" if device == "cuda" else "int8"
+        logger.info("Loading Whisper model size=%s device=%s compute_type=%s", size, device, compute_type)
+        model = WhisperModel(size, device=device, compute_type=compute_type)
+        _WHISPER_MODELS[size] = model
+        while len(_WHISPER_MODELS) > _WHISPER_CACHE_SIZE:
+            evicted, _ = _WHISPER_MODELS.popitem(last=False)
+            logger.info("Evicting Whisper model size=%s from cache", evicted)
+        return model
+
+def preload_models():
+    """
+    Load the default Whisper and Demucs models up front and run one dummy pass through each,
+    so the first request doesn't pay for loading, weight page-faults or device initialisation.
+    """
+    start = timed()
+    whisper_model = _load_whisper_model(_default_model_size())
+    # 1 s of silence; VAD is off so the encoder and decoder actually run
+    segments, _ = whisper_model.transcribe(np.zeros(WHISPER_SR, dtype=np.float32), language="en",
+                                           vad_filter=False, beam_size=1)
+    list(segments)
+    try:
+        demucs_model = _load_demucs_model()
+        silence = torch.zeros(1, demucs_model.audio_channels, demucs_model.samplerate)
+        with torch.no_grad():
+            apply_model(demucs_model, silence, device=_torch_device(), segment=7, split=True, overlap=0.25)
+    except Exception as e:
+        # separation is optional; requests fall back to noise reduction per call
+        logger.exception("Demucs preload failed, separation will fall back: %s", e)
+    logger.info("Preloaded and warmed up models in %dms", timed() - start)
+
+def _transcribe_whisper(model_size: str, audio, language: Optional[str] = None,
+                        initial_prompt: Optional[str] = None):
+    """
+    `audio` is either a file path or a float32 mono array already at WHISPER_SR.
+    """
     start = timed()
     model = _load_whisper_model(model_size)
-    options = {}
-    if language:
-        options["language"] = language
-    # For CPU use fp16=False; whisper API will detect
-    result = model.transcribe(audio_path, **options)
+    segments, info = model.transcribe(audio, language=language, initial_prompt=initial_prompt,
+                                      vad_filter=True, beam_size=1)
+    # faster-whisper yields segments lazily; decoding happens while we iterate
+    seg_list = [{"start": seg.start, "end": seg.end, "text": seg.text} for seg in segments]
+    result = {
+        "segments": seg_list,
+        "text": "".join(seg["text"] for seg in seg_list),
+        "language": info.language
+    }
     timings = {"transcription_ms": int(timed() - start)}
     return result, timings
 
-def _chunk_audio_and_transcribe(wav_path: str, model_size: str, language: Optional[str], chunk_length_sec:int=30, overlap_sec:int=5):
+def _transcribe_whisper_batch(model_size: str, audios: List[np.ndarray], language: Optional[str] = None,
+                              initial_prompt: Optional[str] = None, batch_size: int = 8) -> List[Dict]:
+    """
+    Transcribe several 16 kHz mono arrays with one batched Whisper pass.
+    The arrays are laid end to end and each is cut at VAD speech pauses into <=30 s
+    clips (as BatchedInferencePipeline does for a single input), so the encoder sees
+    clips from every input in the same batch; segments are mapped back per input.
+    """
+    model = _load_whisper_model(model_size)
+    pipeline = BatchedInferencePipeline(model=model)
+    vad_options = VadOptions(max_speech_duration_s=WHISPER_WINDOW_SEC, min_silence_duration_ms=160)
+    clips = []
+    offsets = []
+    pos = 0
+    for audio in audios:
+        offsets.append(pos / WHISPER_SR)
+        speech = get_speech_timestamps(audio, vad_options)
+        for clip in merge_segments(speech, vad_options):
+            clips.append({"start": pos + clip["start"], "end": pos + clip["end"]})
+        pos += len(audio)
+    results = [{"segments": [], "text": "", "language": language} for _ in audios]
+    if not clips:
+        return results
+    segments, info = pipeline.transcribe(np.concatenate(audios), language=language,
+                                         initial_prompt=initial_prompt, clip_timestamps=clips, without_timestamps=False,
+                                         beam_size=1, batch_size=batch_size)
+    for seg in segments:
+        # clips never straddle two inputs, so the segment start identifies its owner
+        idx = bisect.bisect_right(offsets, seg.start + 1e-3) - 1
+        results[idx]["segments"].append({
+            "start": seg.start - offsets[idx],
+            "end": seg.end - offsets[idx],
+            "text": seg.text
+        })
+    for res in results:
+        res["text"] = "".join(seg["text"] for seg in res["segments"])
+        res["language"] = info.language
+    return results
+
+def _detect_language(model_size: str, audio: np.ndarray) -> Optional[str]:
+    """
+    Whisper's language guess for a 16 kHz array, taken from its speech regions.
+    """
+    if not len(audio):
+        return None
+    model = _load_whisper_model(model_size)
+    if not model.model.is_multilingual:
+        return "en"
+    language, _, _ = model.detect_language(audio, vad_filter=True)
+    return language
+
+class BatchScheduler:
     """
-    If the audio is long, split into overlapping chunks and transcribe each chunk then stitch.
+    Coalesces transcription jobs from concurrent requests into batched Whisper calls.
+    A single worker thread drains a bounded queue, collecting up to `max_batch` jobs or
+    waiting at most `max_wait_ms`, and runs jobs that share (model_size, language, prompt)
+    together. Jobs without a language hint are grouped by their detected language.
+    """
+
+    def __init__(self, max_batch: int = 8, max_wait_ms: int = 20, max_queue: int = 64):
+        self.max_batch = max_batch
+        self.max_wait_ms = max_wait_ms
+        self._queue = queue.Queue(maxsize=max_queue)
+        self._thread = None
+        self._lock = threading.Lock()
+
+    def start(self):
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="whisper-batcher", daemon=True)
+                self._thread.start()
+
+    def stop(self):
+        with self._lock:
+            if self._thread is not None:
+                self._queue.put(None)
+                self._thread.join()
+                self._thread = None
+            # jobs queued behind the sentinel would otherwise wait forever
+            while True:
+                try:
+                    job = self._queue.get_nowait()
+                except queue.Empty:
+                    break
+                if job is not None:
+                    job[4].set_exception(RuntimeError("Batch scheduler stopped"))
+
+    def transcribe(self, model_size: str, audio, language: Optional[str] = None,
+                   initial_prompt: Optional[str] = None):
+        """
+        Same contract as _transcribe_whisper, but the job is queued and may share
+        a forward pass with jobs from other requests. Blocks until the result is ready.
+        """
+        start = timed()
+        if isinstance(audio, str):
+            audio = decode_audio(audio, sampling_rate=WHISPER_SR)
+        self.start()
+        future = Future()
+        self._queue.put((model_size, language, initial_prompt, audio, future))
+        result = future.result()
+        timings = {"transcription_ms": int(timed() - start)}
+        return result, timings
+
+    def _run(self):
+        stopping = False
+        while not stopping:
+            job = self._queue.get()
+            if job is None:
+                return
+            jobs = [job]
+            deadline = time.monotonic() + self.max_wait_ms / 1000
+            while len(jobs) < self.max_batch:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    job = self._queue.get(timeout=remaining)
+                except queue.Empty:
+                    break
+                if job is None:
+                    stopping = True
+                    break
+                jobs.append(job)
+            for group in self._group_jobs(jobs):
+                self._run_batch(group)
+
+    def _group_jobs(self, jobs):
+        # a batched pass decodes every input in one language with one prompt, so jobs
+        # without a hint get their language detected first and are keyed on the result
+        groups = {}
+        for job in jobs:
+            model_size, language, initial_prompt = job[0], job[1], job[2]
+            if not language:
+                try:
+                    language = _detect_language(model_size, job[3])
+                except Exception as e:
+                    job[4].set_exception(e)
+                    continue
+                job = (model_size, language, initial_prompt, job[3], job[4])
+            key = (model_size, language, initial_prompt) if language else (model_size, None, id(job))
+            groups.setdefault(key, []).append(job)
+        return list(groups.values())
+
+    def _run_batch(self, jobs):
+        model_size, language, initial_prompt = jobs[0][0], jobs[0][1], jobs[0][2]
+        logger.info("Running batched transcription: model=%s language=%s batch=%d",
+                    model_size, language, len(jobs))
+        try:
+            results = _transcribe_whisper_batch(model_size, [job[3] for job in jobs], language,
+                                                initial_prompt=initial_prompt, batch_size=self.max_batch)
+        except Exception as e:
+            for job in jobs:
+                job[4].set_exception(e)
+            return
+        for job, res in zip(jobs, results):
+            job[4].set_result(res)
+
+def _dedup_overlap(prev_text: str, text: str, min_words: int = 2, max_words: int = 8) -> str:
     """
-    y, sr = librosa.load(wav_path, sr=None, mono=True)
+    Drop words at the start of `text` that repeat the end of `prev_text`
+    (Whisper sometimes re-emits the prompt's last words at a chunk boundary).
+    Words are compared without case or punctuation, and a single repeated word
+    is not treated as overlap since common words legitimately recur at a seam.
+    """
+    def norm(word):
+        return word.strip(string.punctuation).lower()
+
+    prev_words = [norm(w) for w in prev_text.split()]
+    words = text.split()
+    for k in range(min(max_words, len(prev_words), len(words)), min_words - 1, -1):
+        if prev_words[-k:] == [norm(w) for w in words[:k]]:
+            return " ".join(words[k:])
+    return text
+
+def _stitch_segments(offset: float, chunk_segments: List[Dict], prev_text: str = "") -> List[Dict]:
+    """
+    Place one chunk's segments on the file timeline: times are shifted by `offset`,
+    text is stripped, and if `prev_text` (the last non-empty segment already emitted) is
+    given, words the chunk repeats from it at the seam are dropped. Segments left without
+    text are skipped.
+    """
+    segments = []
+    for seg in chunk_segments:
+        text = seg["text"].strip()
+        if prev_text and text:
+            text = _dedup_overlap(prev_text, text)
+            prev_text = ""
+        if not text:
+            continue
+        segments.append({"start": round(seg["start"] + offset, 3),
+                         "end": round(seg["end"] + offset, 3),
+                         "text": text})
+    return segments
+
+def _speech_windows(y: np.ndarray, max_len_sec: int):
+    """
+    Greedily pack Silero VAD speech regions into windows of at most `max_len_sec`,
+    so cuts fall in non-speech gaps. Returns (start_sample, end_sample) pairs at
+    WHISPER_SR; silence between windows is never transcribed.
+    """
+    max_len = int(max_len_sec * WHISPER_SR)
+    # leave room for the VAD's speech padding on either side
+    speech = get_speech_timestamps(y, VadOptions(max_speech_duration_s=max_len_sec - 1))
+    windows = []
+    for ts in speech:
+        start, end = ts["start"], ts["end"]
+        if windows and end - windows[-1][0] <= max_len:
+            windows[-1][1] = end
+            continue
+        # a region still longer than a window is cut at fixed points
+        while end - start > max_len:
+            windows.append([start, start + max_len])
+            start += max_len
+        windows.append([start, end])
+    return [(start, end) for start, end in windows]
+
+def _chunk_audio_and_transcribe(y: np.ndarray, sr: int, model_size: str, language: Optional[str], chunk_length_sec:int=30,
+                                transcribe_fn: Optional[Callable] = None, prompt_chars: int = 200,
+                                on_segments: Optional[Callable] = None, cancel: Optional[threading.Event] = None):
+    """
+    If the audio is long, split it at speech pauses into windows of up to chunk_length_sec,
+    transcribe each window then stitch. Instead of re-encoding an overlap region, each chunk
+    is prompted with the tail of the previous chunk's text so the decoder keeps continuity.
+    `on_segments`, if given, receives each chunk's stitched segments as soon as they are ready.
+    If `cancel` is set, the remaining chunks are skipped.
+    """
+    transcribe = transcribe_fn or _transcribe_whisper
+    # resample once to Whisper's rate so chunks can be passed to the model as arrays
+    y, sr = _resample(y, sr, WHISPER_SR), WHISPER_SR
     total_dur = len(y) / sr
-    chunks = []
-    step = chunk_length_sec - overlap_sec
-    n_chunks = max(1, math.ceil((total_dur - overlap_sec) / step))
-    logger.info("Chunking audio: duration=%.1f sec, chunk_length=%d, overlap=%d -> %d chunks",
-                total_dur, chunk_length_sec, overlap_sec, n_chunks)
+    windows = _speech_windows(y, chunk_length_sec)
+    logger.info("Chunking audio: duration=%.1f sec, max chunk_length=%d -> %d speech chunks (%.1f sec)",
+                total_dur, chunk_length_sec, len(windows), sum(e - s for s, e in windows) / sr)
 
     segments_all = []
-    text_all = []
+    detected_language = None
     timings = {"transcription_ms": 0}
-    for i in range(n_chunks):
-        start_time = max(0, i * step)
-        end_time = min(total_dur, start_time + chunk_length_sec)
-        start_sample = int(start_time * sr)
-        end_sample = int(end_time * sr)
+    prev_text_tail = ""
+
+    for i, (start_sample, end_sample) in enumerate(windows):
+        if cancel is not None and cancel.is_set():
+            logger.info("Transcription cancelled after %d of %d chunks", i, len(windows))
+            break
+        start_time = start_sample / sr
+        # chunks never overlap, so the log-mel faster-whisper computes per chunk covers
+        # each sample exactly once; precomputing one full-file spectrogram would save nothing
         chunk = y[start_sample:end_sample]
-        tmp_chunk_path = f"{wav_path}.chunk{i}.wav"
-        sf.write(tmp_chunk_path, chunk, sr)
-        res, t = _transcribe_whisper(model_size, tmp_chunk_path, language)
+        prompt = prev_text_tail or None
+        res, t = transcribe(model_size, chunk, language, initial_prompt=prompt)
         timings["transcription_ms"] += t["transcription_ms"]
-        # adjust times of returned segments
-        for seg in res.get("segments", []):
-            seg_adj = {
-                "start": round(seg["start"] + start_time, 3),
-                "end": round(seg["end"] + start_time, 3),
-                "text": seg["text"].strip()
-            }
-            segments_all.append(seg_adj)
-            text_all.append(seg["text"].strip())
-        try:
-            os.remove(tmp_chunk_path)
-        except Exception:
-            pass
-    full_text = " ".join([t for t in text_all if t])
-    return {"segments": segments_all, "text": full_text}, timings
+        detected_language = detected_language or res.get("language")
+        # only a prompted chunk can echo the previous text back; stitched segments
+        # always have text, so the last one is the last non-empty segment
+        new_segments = _stitch_segments(start_time, res.get("segments", []),
+                                        prev_text=segments_all[-1]["text"] if prompt and segments_all else "")
+        segments_all.extend(new_segments)
+        if on_segments and new_segments:
+            on_segments(new_segments)
+        prev_text_tail = (prev_text_tail + " " + res.get("text", "").strip()).strip()[-prompt_chars:]
+    full_text = " ".join([seg["text"] for seg in segments_all if seg["text"]])
+    return {"segments": segments_all, "text": full_text, "language": language or detected_language}, timings
+
+def _transcribe_audio(y: np.ndarray, sr: int, model_size: str, language: Optional[str],
+                      transcribe: Callable, on_segments: Optional[Callable] = None,
+                      cancel: Optional[threading.Event] = None):
+    """
+    Transcribe the (separated) audio, chunking long files. Runs in a worker thread.
+    """
+    duration_sec = len(y) / sr
+    if duration_sec > 45:
+        # chunk and transcribe
+        logger.info("Long file detected (%.2fs). Using chunking.", duration_sec)
+        return _chunk_audio_and_transcribe(y, sr, model_size, language,
+                                           chunk_length_sec=WHISPER_WINDOW_SEC,
+                                           transcribe_fn=transcribe, on_segments=on_segments,
+                                           cancel=cancel)
+    # single-shot transcribe
+    res, t = transcribe(model_size, _resample(y, sr, WHISPER_SR), language)
+    # res contains 'text' and 'segments'
+    results = {
+        "segments": _stitch_segments(0.0, res.get("segments", [])),
+        "text": res.get("text", "").strip(),
+        "language": res.get("language", language)
+    }
+    if on_segments and results["segments"]:
+        on_segments(results["segments"])
+    return results, t
 
-def process_audio_file(input_path: str,
+async def process_audio_file(input_path: str,
                        request_id: str,
                        language_hint: Optional[str] = None,
                        enable_separation: bool = True,
                        diarize: bool = False,
-                       model_size: str = "small",
+                       model_size: Optional[str] = None,
                        target_sr: int = 16000,
-                       tmpdir: Optional[str] = None) -> Dict:
+                       transcribe_fn: Optional[Callable] = None) -> Dict:
+    """
+    Run the whole pipeline and return the complete response dict.
+    """
+    response = {}
+    async for event in stream_audio_file(input_path, request_id, language_hint=language_hint,
+                                         enable_separation=enable_separation, diarize=diarize,
+                                         model_size=model_size, target_sr=target_sr,
+                                         transcribe_fn=transcribe_fn):
+        kind = event.pop("type")
+        if kind == "segment":
+            response["segments"].append(event)
+        else:
+            response.update(event)
+            if kind == "info":
+                response["segments"] = []
+    return response
+
+async def stream_audio_file(input_path: str,
+                            request_id: str,
+                            language_hint: Optional[str] = None,
+                            enable_separation: bool = True,
+                            diarize: bool = False,
+                            model_size: Optional[str] = None,
+                            target_sr: int = 16000,
+                            transcribe_fn: Optional[Callable] = None):
+    """
+    Same pipeline as process_audio_file, but yields events as they are produced: an "info"
+    event once the audio is loaded and separated, a "segment" event per transcribed segment
+    (chunk by chunk for long files), and a final "done" event with text, language and timings.
+    """
+    model_size = model_size or _default_model_size()
+    logger.info("[%s] Using separation device=%s, whisper device=%s, model=%s",
+                request_id, _torch_device(), _whisper_device(), model_size)
+    # transcribe_fn lets the API route Whisper calls through a shared BatchScheduler
+    transcribe = transcribe_fn or _transcribe_whisper
     timings = {"load": 0, "separation": 0, "transcription": 0, "total": 0}
     start_load = timed()
-    base_tmp = tmpdir or tempfile.mkdtemp()
-    # 1) convert to WAV 16k mono
-    wav_path = os.path.join(base_tmp, f"{uuid.uuid4().hex}_normalized.wav")
-    _ffmpeg_convert_to_wav(input_path, wav_path, target_sr)
-    info = _read_wav_info(wav_path)
+    # 1) decode to one float32 mono buffer at target_sr; every later stage works on it in memory
+    y = await _ffmpeg_decode(input_path, target_sr)
+    info = {"sample_rate": target_sr, "duration_sec": len(y) / target_sr}
     timings["load"] = int(timed() - start_load)
 
     # 2) separation (attempt demucs)
-    vocals_path = None
+    vocals = None
     separation_start = timed()
     separation_used = None
     try:
         if enable_separation:
-            demucs_out = os.path.join(base_tmp, "demucs_out")
-            os.makedirs(demucs_out, exist_ok=True)
             try:
-                vocals_path = _demucs_separate(wav_path, demucs_out)
+                vocals = await asyncio.to_thread(_demucs_separate, y, target_sr)
                 separation_used = "demucs"
             except Exception as e:
                 logger.exception("Demucs separation failed: %s", e)
                 # fallback to noise reduction
-                fallback_vocals = os.path.join(base_tmp, "vocals_nr.wav")
-                vocals_path = _noise_reduction_fallback(wav_path, fallback_vocals)
+                vocals = await asyncio.to_thread(_noise_reduction_fallback, y, target_sr)
                 separation_used = "noise-reduction-fallback"
         else:
             separation_used = "disabled"
-            vocals_path = wav_path
+            vocals = y
     except Exception as e:
         # If separation step raises, fallback gracefully
         logger.exception("Separation stage failed completely, falling back to original audio")
-        vocals_path = wav_path
+        vocals = y
         separation_used = "failed-fallback-to-original"
     timings["separation"] = int(timed() - separation_start)
 
-    # 3) If file is long, chunk then transcribe
+    yield {
+        "type": "info",
+        "duration_sec": round(info["duration_sec"], 3),
+        "sample_rate": int(info["sample_rate"]),
+        "pipeline": {
+            "separation": {"enabled": enable_separation, "method": separation_used},
+            "transcription": {"model": model_size}
+        }
+    }
+
+    # 3) If file is long, chunk then transcribe (model work runs in a worker thread
+    # so the event loop keeps serving other requests; segments are handed back per chunk)
     trans_start = timed()
-    results = None
+    loop = asyncio.get_running_loop()
+    pending = asyncio.Queue()
+    # cancelling the task doesn't stop its thread, so the chunk loop checks this flag instead
+    cancel = threading.Event()
+
+    def on_segments(segments):
+        loop.call_soon_threadsafe(pending.put_nowait, segments)
+
+    def run():
+        try:
+            return _transcribe_audio(vocals, target_sr, model_size, language_hint,
+                                     transcribe, on_segments=on_segments, cancel=cancel)
+        finally:
+            loop.call_soon_threadsafe(pending.put_nowait, None)
+
+    task = asyncio.ensure_future(asyncio.to_thread(run))
     try:
-        if info["duration_sec"] > 45:
-            # chunk and transcribe
-            logger.info("Long file detected (%.2fs). Using chunking.", info["duration_sec"])
-            trans, t = _chunk_audio_and_transcribe(vocals_path, model_size, language_hint,
-                                                   chunk_length_sec=30, overlap_sec=5)
-            timings["transcription"] = t["transcription_ms"]
-            results = trans
-        else:
-            # single-shot transcribe
-            res, t = _transcribe_whisper(model_size, vocals_path, language_hint)
-            timings["transcription"] = t["transcription_ms"]
-            # res contains 'text' and 'segments'
-            segments = []
-            for seg in res.get("segments", []):
-                segments.append({
-                    "start": round(seg["start"], 3),
-                    "end": round(seg["end"], 3),
-                    "text": seg["text"].strip()
-                })
-            results = {
-                "segments": segments,
-                "text": res.get("text", "").strip(),
-                "language": res.get("language", language_hint)
-            }
+        while (segments := await pending.get()) is not None:
+            for seg in segments:
+                yield {"type": "segment", **seg}
+        results, _ = await task
     except Exception as e:
         logger.exception("Transcription failed")
         raise
+    finally:
+        # the client may disconnect mid-stream; don't leave the task's outcome unretrieved
+        if not task.done():
+            cancel.set()
+            task.cancel()
+        elif not task.cancelled():
+            task.exception()
 
     timings["transcription"] = int(timed() - trans_start)
 
@@ -220,18 +603,10 @@ def process_audio_file(input_path: str,
         logger.warning("Diarization requested but not implemented in this reference. Set diarize=False.")
         diarization_result = {"warning": "diarization not implemented in reference code"}
 
-    # Compose response
-    response = {
-        "duration_sec": round(info["duration_sec"], 3),
-        "sample_rate": int(info["sample_rate"]),
-        "pipeline": {
-            "separation": {"enabled": enable_separation, "method": separation_used},
-            "transcription": {"model": model_size}
-        },
-        "segments": results.get("segments", []),
+    yield {
+        "type": "done",
         "text": results.get("text", ""),
         "language": results.get("language") or language_hint or "und",
         "timings_ms": timings,
         "diarization": diarization_result
     }
-    return response
@@ -2,6 +2,7 @@
 from fastapi.testclient import TestClient
 from src.app import app
 import io
+import json
 
 client = TestClient(app)
 
@@ -10,6 +11,12 @@ def test_health_and_transcribe_invalid():
     r = client.post("/v1/transcribe")
     assert r.status_code == 422
 
+def test_transcribe_invalid_config():
+    with open("sample_audio/clean_speech.wav", "rb") as fh:
+        files = {"file": ("clean_speech.wav", fh, "audio/wav")}
+        r = client.post("/v1/transcribe", files=files, data={"config": '{"target_sr": "abc"}'})
+        assert r.status_code == 400
+
 def test_transcribe_small_sample():
     # This test assumes you have sample audio at sample_audio/speech_clean.wav
     with open("sample_audio/speech_clean.wav", "rb") as fh:
@@ -19,3 +26,22 @@ def test_transcribe_small_sample():
         j = r.json()
         assert "request_id" in j
         assert "text" in j
+
+def test_transcribe_stream_ndjson():
+    with open("sample_audio/clean_speech.wav", "rb") as fh:
+        files = {"file": ("clean_speech.wav", fh, "audio/wav")}
+        r = client.post("/v1/transcribe", files=files,
+                        data={"config": '{"model_size":"tiny","enable_separation":false,"stream":true}'})
+        assert r.status_code == 200
+        assert r.headers["content-type"].startswith("application/x-ndjson")
+        events = [json.loads(line) for line in r.text.splitlines() if line]
+        assert events[0]["type"] == "info"
+        assert "request_id" in events[0]
+        assert events[-1]["type"] == "done"
+        assert "text" in events[-1]
+
+def test_transcribe_stream_undecodable_file():
+    # decoding fails before the first event, so the error still gets a status code
+    files = {"file": ("broken.wav", io.BytesIO(b"not audio"), "audio/wav")}
+    r = client.post("/v1/transcribe", files=files, data={"config": '{"stream":true}'})
+    assert r.status_code == 500
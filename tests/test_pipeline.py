@@ -0,0 +1,63 @@
+# tests/test_pipeline.py
+from concurrent.futures import Future
+from types import SimpleNamespace
+import numpy as np
+from src import pipeline
+
+def test_dedup_overlap_folds_case_and_punctuation():
+    assert pipeline._dedup_overlap("and then we went home.", "We went Home, and slept") == "and slept"
+
+def test_dedup_overlap_ignores_single_word():
+    assert pipeline._dedup_overlap("this is the", "the end") == "the end"
+
+def test_dedup_overlap_full_echo():
+    assert pipeline._dedup_overlap("so that was it", "that was it.") == ""
+
+def test_stitch_segments_drops_echoed_segment():
+    segments = [{"start": 0.0, "end": 1.0, "text": " that was it."},
+                {"start": 1.0, "end": 2.5, "text": " Next topic."}]
+    stitched = pipeline._stitch_segments(30.0, segments, prev_text="so that was it")
+    assert stitched == [{"start": 31.0, "end": 32.5, "text": "Next topic."}]
+
+def test_transcribe_whisper_batch_maps_segments_to_inputs(monkeypatch):
+    calls = []
+
+    class FakePipeline:
+        def __init__(self, model):
+            pass
+
+        def transcribe(self, audio, **kwargs):
+            calls.append((audio, kwargs))
+            segments = [SimpleNamespace(start=clip["start"] / 16000, end=clip["end"] / 16000, text=f" clip{i}")
+                        for i, clip in enumerate(kwargs["clip_timestamps"])]
+            return iter(segments), SimpleNamespace(language="en")
+
+    monkeypatch.setattr(pipeline, "_load_whisper_model", lambda size: None)
+    monkeypatch.setattr(pipeline, "BatchedInferencePipeline", FakePipeline)
+    monkeypatch.setattr(pipeline, "get_speech_timestamps",
+                        lambda audio, opts: [{"start": 0, "end": len(audio)}])
+    monkeypatch.setattr(pipeline, "merge_segments", lambda speech, opts: speech)
+
+    results = pipeline._transcribe_whisper_batch("tiny", [np.zeros(16000, np.float32), np.ones(32000, np.float32)])
+
+    audio, kwargs = calls[0]
+    assert len(audio) == 48000
+    assert kwargs["clip_timestamps"] == [{"start": 0, "end": 16000}, {"start": 16000, "end": 48000}]
+    assert results[0]["segments"] == [{"start": 0.0, "end": 1.0, "text": " clip0"}]
+    assert results[1]["segments"] == [{"start": 0.0, "end": 2.0, "text": " clip1"}]
+    assert [res["language"] for res in results] == ["en", "en"]
+
+def test_batch_scheduler_groups_by_detected_language(monkeypatch):
+    monkeypatch.setattr(pipeline, "_detect_language", lambda size, audio: "de" if audio[0] else "en")
+    english, german = np.zeros(10, np.float32), np.ones(10, np.float32)
+    jobs = [("tiny", None, None, english, Future()),
+            ("tiny", None, None, german, Future()),
+            ("tiny", "en", None, english, Future()),
+            ("tiny", None, None, english, Future()),
+            ("tiny", None, "previous text", english, Future())]
+
+    groups = pipeline.BatchScheduler()._group_jobs(jobs)
+
+    assert [[job[4] for job in group] for group in groups] == [
+        [jobs[0][4], jobs[2][4], jobs[3][4]], [jobs[1][4]], [jobs[4][4]]]
+    assert [group[0][1] for group in groups] == ["en", "de", "en"]